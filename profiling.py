@@ -0,0 +1,119 @@
+"""
+Sampling profiler used by server.py to profile a single request.
+
+It lives in its own module so the profiler's own allocations can be left
+out of the results by file name (see SKIPPED_FILES).
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+
+#
+# Peak snapshots are taken only when the request's memory growth has at least doubled since the
+# last one (starting at SNAPSHOT_MIN_BYTES), and at most MAX_SNAPSHOTS times. A snapshot costs
+# time proportional to the number of live allocations and holds the GIL, so taking one on every
+# new high would mostly profile the snapshots. With doubling, all snapshots together cost about
+# twice the last one, and the last one still holds at least half of the request's peak growth.
+#
+SNAPSHOT_GROWTH = 2
+SNAPSHOT_MIN_BYTES = 1024 * 1024
+MAX_SNAPSHOTS = 8
+
+
+class RequestProfiler:
+    """
+    Samples the stack of one thread every `interval` seconds into collapsed-stack
+    counts, and records tracemalloc peak memory and the largest allocation sites
+    until stop() is called.
+    """
+    def __init__(self, thread_id, interval, top_allocations):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.top_allocations = top_allocations
+        self.stacks = {}
+        self.samples = 0
+        self.snapshots = 0
+        self.snapshot_seconds = 0.0
+        self.done = threading.Event()
+        self.sampler = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.started = time.time()
+        self.start_clock = time.perf_counter()
+        tracemalloc.start()
+        try:
+            self.start_snapshot = tracemalloc.take_snapshot()
+            self.start_bytes = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            self.peak_snapshot = None
+            self.next_snapshot_at = SNAPSHOT_MIN_BYTES
+            self.sampler.start()
+        except Exception:
+            tracemalloc.stop()
+            raise
+
+    def take_snapshot(self):
+        clock = time.perf_counter()
+        self.peak_snapshot = tracemalloc.take_snapshot()
+        self.snapshot_seconds += time.perf_counter() - clock
+        self.snapshots += 1
+
+    def check_growth(self):
+        growth = tracemalloc.get_traced_memory()[0] - self.start_bytes
+        if growth >= self.next_snapshot_at and self.snapshots < MAX_SNAPSHOTS:
+            self.take_snapshot()
+            self.next_snapshot_at = growth * SNAPSHOT_GROWTH
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+            self.check_growth()
+
+    def stop(self):
+        self.done.set()
+        try:
+            self.sampler.join()
+            self.duration = time.perf_counter() - self.start_clock
+            # A request that never grew past SNAPSHOT_MIN_BYTES gets its only snapshot here.
+            if self.peak_snapshot is None:
+                self.take_snapshot()
+            self.peak_bytes = max(tracemalloc.get_traced_memory()[1] - self.start_bytes, 0)
+        finally:
+            tracemalloc.stop()
+
+        # Grouping by line keeps one frame per allocation, so dropping whole files after
+        # grouping is the same as tracemalloc.Filter but doesn't walk every trace twice.
+        self.allocations = []
+        for stat in self.peak_snapshot.compare_to(self.start_snapshot, 'lineno'):
+            frame = stat.traceback[0]
+            if stat.size_diff <= 0 or frame.filename in SKIPPED_FILES:
+                continue
+            self.allocations.append({
+                "location": f"{frame.filename}:{frame.lineno}",
+                "size": stat.size_diff,
+                "count": stat.count_diff
+            })
+            if len(self.allocations) == self.top_allocations:
+                break
+
+
+# The sampler thread's own work happens in these files, so it is left out of the allocations.
+# Code filenames are used because stdlib modules like posixpath may be frozen.
+SKIPPED_FILES = {
+    RequestProfiler.run.__code__.co_filename,
+    tracemalloc.take_snapshot.__code__.co_filename,
+    threading.Event.wait.__code__.co_filename,
+    os.path.basename.__code__.co_filename
+}
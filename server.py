@@ -9,10 +9,20 @@ A debugger such as "pdb" may be helpful for debugging.
 Read about it online.
 """
 import os
+import json
+import hmac
+import bisect
+import heapq
+import operator
+import random
+import threading
+import time
+import tracemalloc
+from profiling import RequestProfiler
 # accessible as a variable in index.html:
 from sqlalchemy import *
 from sqlalchemy.pool import NullPool
-from flask import Flask, request, render_template, g, redirect, Response, abort, make_response
+from flask import Flask, request, render_template, g, redirect, Response, abort, make_response, jsonify
 from datetime import date
 
 tmpl_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
@@ -41,8 +51,11 @@ DATABASEURI = f"postgresql://{DATABASE_USERNAME}:{DATABASE_PASSWRD}@{DATABASE_HO
 
 #
 # This line creates a database engine that knows how to connect to the URI above.
+# The pool sizes are spelled out because admission control below is sized from them.
 #
-engine = create_engine(DATABASEURI)
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+engine = create_engine(DATABASEURI, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW)
 
 #
 # Example of running queries in your database
@@ -62,15 +75,524 @@ with engine.connect() as conn:
     conn.commit()
 
 
+#
+# Admission control.
+#
+# index() reads the whole review feed, and dishes() and restaurant_info() run one allergen
+# query per dish, so under a traffic spike they hold connections long enough to drain the
+# engine's pool (POOL_SIZE + MAX_OVERFLOW connections). The pool is split in two:
+#
+#   - the cheap routes in CHEAP_ENDPOINTS (/login, /register) share a limiter of
+#     RESERVED_SLOTS connections, so they keep working during a spike;
+#   - every other route that uses the database shares a limiter of the remaining
+#     POOL_CAPACITY - RESERVED_SLOTS connections. The heaviest routes also get their own
+#     limit, so one of them can't take the whole share; together those limits add up to more
+#     than the shared cap, so the shared cap is what bounds a spike across all of them.
+#
+# Routes in NO_DB_ENDPOINTS never take a connection and skip admission entirely.
+# Each limiter has a bounded wait line. When a line is full (or a request waits longer than
+# ADMISSION_WAIT_SECONDS) we answer right away with 503 + Retry-After.
+#
+# This only matters when requests run concurrently in one process, i.e. when the server is
+# started with --threaded (or under a threaded WSGI server). The default single-threaded
+# server handles one request at a time, so nothing ever queues or gets shed.
+#
+POOL_CAPACITY = POOL_SIZE + MAX_OVERFLOW
+RESERVED_SLOTS = 3
+ADMISSION_WAIT_SECONDS = 5
+RETRY_AFTER_SECONDS = 2
+
+CHEAP_ENDPOINTS = {'login', 'register'}
+
+# Routes that never need g.conn, so before_request doesn't check out a pool connection.
+NO_DB_ENDPOINTS = {'metrics', 'logout', 'static'}
+
+
+class RouteLimiter:
+    """
+    Allows at most `max_active` requests to run at once and at most `max_queued`
+    requests to wait for a turn. Counters are kept so they can be exported at /metrics.
+    """
+    def __init__(self, name, max_active, max_queued):
+        self.name = name
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, timeout):
+        with self.cond:
+            if self.active < self.max_active:
+                self.active += 1
+                return True
+            if self.queued >= self.max_queued:
+                return False
+            self.queued += 1
+            try:
+                got_slot = self.cond.wait_for(lambda: self.active < self.max_active, timeout)
+            finally:
+                self.queued -= 1
+            if not got_slot:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify()
+
+    def record(self, admitted):
+        # Counted by admit_request() once every limiter on the way has decided.
+        with self.cond:
+            if admitted:
+                self.admitted += 1
+            else:
+                self.shed += 1
+
+    def stats(self):
+        with self.cond:
+            return {
+                "max_active": self.max_active,
+                "max_queued": self.max_queued,
+                "active": self.active,
+                "queued": self.queued,
+                "admitted": self.admitted,
+                "shed": self.shed
+            }
+
+
+reserved_limiter = RouteLimiter("reserved", RESERVED_SLOTS, 20)
+shared_limiter = RouteLimiter("shared", max(POOL_CAPACITY - RESERVED_SLOTS, 1), 20)
+route_limiters = {
+    "index": RouteLimiter("index", 6, 8),
+    "dishes": RouteLimiter("dishes", 6, 8),
+    "restaurant_info": RouteLimiter("restaurant_info", 6, 8)
+}
+
+
+def admit_request():
+    """
+    Takes a slot in the reserved limiter for cheap routes, or in the route's own limiter
+    (if it has one) and then the shared limiter for everything else.
+    Returns False (holding nothing) if any of them sheds the request.
+    """
+    g.admission = []
+    if request.endpoint in NO_DB_ENDPOINTS:
+        return True
+
+    if request.endpoint in CHEAP_ENDPOINTS:
+        limiters = [reserved_limiter]
+    else:
+        limiters = [shared_limiter]
+        if request.endpoint in route_limiters:
+            limiters.insert(0, route_limiters[request.endpoint])
+
+    deadline = time.monotonic() + ADMISSION_WAIT_SECONDS
+    for lim in limiters:
+        if not lim.acquire(max(deadline - time.monotonic(), 0)):
+            for tried in g.admission + [lim]:
+                tried.record(False)
+            release_admission()
+            return False
+        g.admission.append(lim)
+
+    for lim in g.admission:
+        lim.record(True)
+    return True
+
+
+def release_admission():
+    for lim in reversed(g.get('admission', [])):
+        lim.release()
+    g.admission = []
+
+
+#
+# On-demand request profiling.
+#
+# A request is profiled when it carries the header "X-Profile: <PROFILE_TOKEN>", or when it is
+# picked at random with probability PROFILE_SAMPLE_RATE. The token is only accepted as a
+# header, never in the URL, so it doesn't end up in access logs. While it runs, a
+# background thread samples the request thread's stack every PROFILE_INTERVAL seconds and
+# tracemalloc records allocations, so we can tell SQLAlchemy row handling, the dict building
+# loops and Jinja rendering apart. Stacks are saved in collapsed form ("a;b;c count"), which
+# flamegraph.pl and speedscope read directly. Only one request is profiled at a time since
+# tracemalloc is process-wide, and the store keeps the newest PROFILE_MAX_FILES profiles.
+#
+# The saved allocations come from a few snapshots the sampler takes as the request's memory
+# grows (see profiling.py), diffed against one taken at the start, i.e. what the request was
+# holding near its peak rather than what survived to teardown. The time spent on snapshots is
+# saved as snapshot_ms. Because tracemalloc is process-wide, peak_bytes and the allocations
+# also include whatever other request threads allocated in the meantime; with --threaded
+# (which admission control needs) treat them as approximate while other requests are running.
+#
+# Leave PROFILE_TOKEN unset in .env to turn profiling and the admin pages off entirely.
+#
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_INTERVAL = 0.005
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+PROFILE_MAX_FILES = 50
+PROFILE_TOP_ALLOCATIONS = 25
+
+profile_lock = threading.Lock()
+
+
+def has_profile_token():
+    token = request.headers.get('X-Profile')
+    if not PROFILE_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+# The admin pages only read files under PROFILE_DIR, so they skip admission and the pool.
+PROFILE_ADMIN_ENDPOINTS = {'admin_profiles', 'admin_profile', 'admin_profile_collapsed'}
+NO_DB_ENDPOINTS.update(PROFILE_ADMIN_ENDPOINTS)
+
+
+def should_profile():
+    if not PROFILE_TOKEN:
+        return False
+    if request.endpoint in PROFILE_ADMIN_ENDPOINTS:
+        return False
+    if has_profile_token():
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def start_profile():
+    g.profiler = None
+    if not should_profile() or not profile_lock.acquire(blocking=False):
+        return
+    profiler = RequestProfiler(threading.get_ident(), PROFILE_INTERVAL, PROFILE_TOP_ALLOCATIONS)
+    try:
+        profiler.start()
+    except Exception as e:
+        print(f"Starting profiler failed: {str(e)}")
+        profile_lock.release()
+        return
+    g.profiler = profiler
+
+
+def finish_profile():
+    profiler = g.get('profiler')
+    if profiler is None:
+        return
+    g.profiler = None
+    try:
+        profiler.stop()
+    except Exception as e:
+        print(f"Profiling failed: {str(e)}")
+        return
+    finally:
+        profile_lock.release()
+
+    try:
+        save_profile(profiler)
+    except Exception as e:
+        print(f"Saving profile failed: {str(e)}")
+
+
+#
+# Each profile is one file with two JSON lines: a small summary for the /admin/profiles
+# listing, then the allocations and stacks. Files are written under a temporary name and
+# renamed into place so readers never see a half-written profile.
+#
+def save_profile(profiler):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = f"{int(profiler.started * 1000)}-{request.endpoint or 'unknown'}"
+    summary = {
+        "id": profile_id,
+        "path": request.path,
+        "method": request.method,
+        "endpoint": request.endpoint,
+        "started": profiler.started,
+        "duration_ms": round(profiler.duration * 1000, 2),
+        "samples": profiler.samples,
+        "interval_ms": PROFILE_INTERVAL * 1000,
+        "peak_bytes": profiler.peak_bytes,
+        "snapshots": profiler.snapshots,
+        "snapshot_ms": round(profiler.snapshot_seconds * 1000, 2)
+    }
+    details = {
+        "allocations": profiler.allocations,
+        "stacks": profiler.stacks
+    }
+    path = os.path.join(PROFILE_DIR, profile_id + ".json")
+    with open(path + ".tmp", "w") as f:
+        f.write(json.dumps(summary) + "\n")
+        f.write(json.dumps(details) + "\n")
+    os.replace(path + ".tmp", path)
+
+    # Drop the oldest profiles so the store stays bounded.
+    saved = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith(".json"))
+    for name in saved[:-PROFILE_MAX_FILES]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except FileNotFoundError:
+            pass
+
+
+def read_profile(profile_id, summary_only=False):
+    """
+    Returns the saved profile, or None if it is gone or can't be parsed.
+    """
+    try:
+        with open(os.path.join(PROFILE_DIR, profile_id + ".json")) as f:
+            record = json.loads(f.readline())
+            if not summary_only:
+                record.update(json.loads(f.readline()))
+            return record
+    except (OSError, ValueError):
+        return None
+
+
+def load_profile(profile_id):
+    if os.path.basename(profile_id) != profile_id:
+        abort(404)
+    record = read_profile(profile_id)
+    if record is None:
+        abort(404)
+    return record
+
+
+#
+# In-memory prefix index for the /autocomplete typeahead.
+#
+# Every restaurant and dish name is stored under its lowercased full name and under each
+# later word ("joe's pizza" is also found as "pizza") in one sorted list, so the matches for
+# a prefix are one contiguous slice found with two bisects, and a lookup never touches
+# Postgres. The index is loaded once on the first lookup and afterwards kept current by
+# add_restaurant(), add_dish() and add_review(). Matches are ranked by review count, then
+# average rating. A dish is weighted by the best reviewed restaurant that serves it, so a
+# review reweights the restaurant and every dish it serves.
+#
+# Each entry carries a ready-made sort key ("rank"), and the top AUTOCOMPLETE_MAX_LIMIT
+# results of each prefix looked up are cached (up to AUTOCOMPLETE_CACHE_SIZE prefixes). The
+# one-letter prefixes, which match the most names and are the most common lookups, are
+# filled in when the index loads. Ranks only ever improve (review counts only go up, and a
+# dish only gains restaurants), so a change just moves the entry up in, or into, the cached
+# lists of its own prefixes instead of throwing them away.
+#
+AUTOCOMPLETE_LIMIT = 8
+AUTOCOMPLETE_MAX_LIMIT = 50
+AUTOCOMPLETE_CACHE_SIZE = 10000
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.keys = []
+        self.entries = {}
+        self.dishes_by_restaurant = {}
+        self.review_ids = set()
+        self.top_cache = {}
+        self.version = 0
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def ensure_loaded(self):
+        with self.lock:
+            if self.loaded:
+                return
+            restaurant_query = """
+                SELECT restaurant_id, name
+                FROM Restaurant
+            """
+            review_query = """
+                SELECT review_id, restaurant_id, rating
+                FROM Review
+            """
+            dish_query = """
+                SELECT d.dish_id, d.name, s.restaurant_id
+                FROM Dish d
+                LEFT JOIN Serves s ON d.dish_id = s.dish_id
+            """
+            # /autocomplete skips admission, so this one-time load takes a pool connection
+            # outside the limiters.
+            with engine.connect() as conn:
+                restaurant_rows = conn.execute(text(restaurant_query)).fetchall()
+                review_rows = conn.execute(text(review_query)).fetchall()
+                dish_rows = conn.execute(text(dish_query)).fetchall()
+
+            for result in restaurant_rows:
+                self.insert("restaurant", result[0], result[1], reviews=(0, 0.0))
+            for result in review_rows:
+                self.count_review(result[0], result[1], result[2])
+            for result in dish_rows:
+                self.insert_dish(result[0], result[1], result[2])
+            self.keys.sort()
+            self.loaded = True
+
+        for letter in sorted({key[0][0] for key in self.keys}):
+            self.search(letter)
+
+    # search() reads entries outside the lock, so their fields are only ever replaced,
+    # never changed in place.
+
+    def insert(self, kind, item_id, name, **fields):
+        if not name or (kind, item_id) in self.entries:
+            return
+        entry = dict(type=kind, id=item_id, name=name, **fields)
+        self.entries[(kind, item_id)] = entry
+        for key in self.keys_of(entry):
+            # While loading, keys are sorted once at the end instead of on every insert.
+            if self.loaded:
+                bisect.insort(self.keys, key)
+            else:
+                self.keys.append(key)
+        self.rerank(entry)
+
+    def insert_dish(self, dish_id, name, restaurant_id):
+        self.insert("dish", dish_id, name, restaurant_ids=())
+        dish = self.entries.get(("dish", dish_id))
+        if dish is None or restaurant_id is None or restaurant_id in dish["restaurant_ids"]:
+            return
+        dish["restaurant_ids"] = dish["restaurant_ids"] + (restaurant_id,)
+        self.dishes_by_restaurant.setdefault(restaurant_id, set()).add(dish_id)
+        self.rerank(dish)
+
+    def count_review(self, review_id, restaurant_id, rating):
+        # The ids make this safe to call for a review the initial load already counted.
+        if review_id in self.review_ids:
+            return
+        self.review_ids.add(review_id)
+        restaurant = self.entries.get(("restaurant", restaurant_id))
+        if restaurant is None:
+            return
+        count, rating_sum = restaurant["reviews"]
+        restaurant["reviews"] = (count + 1, rating_sum + float(rating))
+        self.rerank(restaurant)
+        for dish_id in self.dishes_by_restaurant.get(restaurant_id, ()):
+            self.rerank(self.entries[("dish", dish_id)])
+
+    def weight(self, entry):
+        """
+        Returns (review_count, avg_rating) for a restaurant, or for the best
+        reviewed restaurant serving a dish.
+        """
+        if entry["type"] == "restaurant":
+            restaurants = [entry]
+        else:
+            restaurants = [self.entries[("restaurant", rid)] for rid in entry["restaurant_ids"]
+                           if ("restaurant", rid) in self.entries]
+        best = (0, 0)
+        for restaurant in restaurants:
+            count, rating_sum = restaurant["reviews"]
+            avg_rating = round(rating_sum / count, 1) if count else 0
+            best = max(best, (count, avg_rating))
+        return best
+
+    def rerank(self, entry):
+        # Called with the lock held whenever an entry is added or its weight may have changed.
+        count, avg_rating = self.weight(entry)
+        rank = (-count, -avg_rating, entry["name"], entry["type"], entry["id"])
+        entry["rank"] = rank
+        self.version += 1
+        if not self.top_cache:
+            return
+
+        prefixes = set()
+        for key, kind, item_id in self.keys_of(entry):
+            prefixes.update(key[:n] for n in range(1, len(key) + 1))
+        for prefix in prefixes:
+            for kind in (None, entry["type"]):
+                ranked = self.top_cache.get((prefix, kind))
+                if ranked is None:
+                    continue
+                # A list shorter than AUTOCOMPLETE_MAX_LIMIT holds every match of its prefix.
+                if any(e is entry for e in ranked) or len(ranked) < AUTOCOMPLETE_MAX_LIMIT or rank < ranked[-1]["rank"]:
+                    ranked = [e for e in ranked if e is not entry] + [entry]
+                    ranked.sort(key=operator.itemgetter("rank"))
+                    self.top_cache[(prefix, kind)] = ranked[:AUTOCOMPLETE_MAX_LIMIT]
+
+    def keys_of(self, entry):
+        words = entry["name"].lower().split()
+        return [(" ".join(words[i:]), entry["type"], entry["id"]) for i in range(len(words))]
+
+    def add_restaurant(self, restaurant_id, name):
+        with self.lock:
+            if self.loaded:
+                self.insert("restaurant", restaurant_id, name, reviews=(0, 0.0))
+
+    def add_dish(self, dish_id, name, restaurant_id):
+        with self.lock:
+            if self.loaded:
+                self.insert_dish(dish_id, name, restaurant_id)
+
+    def add_review(self, review_id, restaurant_id, rating):
+        with self.lock:
+            if self.loaded:
+                self.count_review(review_id, restaurant_id, rating)
+
+    def search(self, prefix, kind=None, limit=AUTOCOMPLETE_LIMIT):
+        prefix = " ".join(prefix.lower().split())
+        if not prefix:
+            return []
+        self.ensure_loaded()
+
+        with self.lock:
+            ranked = self.top_cache.get((prefix, kind))
+            if ranked is None:
+                version = self.version
+                lo = bisect.bisect_left(self.keys, (prefix,))
+                hi = bisect.bisect_left(self.keys, (prefix + "\U0010ffff",))
+                keys = self.keys[lo:hi]
+
+        if ranked is None:
+            # Ranking happens outside the lock so other lookups don't queue behind it.
+            matches = {}
+            for key, entry_kind, item_id in keys:
+                if kind is None or entry_kind == kind:
+                    matches[(entry_kind, item_id)] = self.entries[(entry_kind, item_id)]
+            ranked = heapq.nsmallest(AUTOCOMPLETE_MAX_LIMIT, matches.values(),
+                                     key=operator.itemgetter("rank"))
+            with self.lock:
+                if self.version == version:
+                    if len(self.top_cache) >= AUTOCOMPLETE_CACHE_SIZE:
+                        self.top_cache.pop(next(iter(self.top_cache)))
+                    self.top_cache[(prefix, kind)] = ranked
+
+        return [
+            {
+                "type": entry["type"],
+                "id": entry["id"],
+                "name": entry["name"],
+                "review_count": -entry["rank"][0],
+                "avg_rating": -entry["rank"][1]
+            }
+            for entry in ranked[:limit]
+        ]
+
+
+name_index = PrefixIndex()
+NO_DB_ENDPOINTS.add('autocomplete')
+
+
 @app.before_request
 def before_request():
     """
-    This function is run at the beginning of every web request 
+    This function is run at the beginning of every web request
     (every time you enter an address in the web browser).
     We use it to setup a database connection that can be used throughout the request.
 
     The variable g is globally accessible.
     """
+    # Admission happens before we take a connection, so shed requests never touch the pool.
+    if not admit_request():
+        g.conn = None
+        resp = make_response("Server is busy, please try again shortly.", 503)
+        resp.headers['Retry-After'] = str(RETRY_AFTER_SECONDS)
+        return resp
+
+    start_profile()
+
+    if request.endpoint in NO_DB_ENDPOINTS:
+        g.conn = None
+        return
+
     try:
         g.conn = engine.connect()
     except:
@@ -88,6 +610,10 @@ def teardown_request(exception):
         g.conn.close()
     except Exception as e:
         pass
+    try:
+        finish_profile()
+    finally:
+        release_admission()
 
 
 #
@@ -273,11 +799,14 @@ def add_restaurant():
                 insert_restaurant = """
                 INSERT INTO Restaurant (name, address, cuisine)
                 VALUES (:name, :address, :cuisine)
+                RETURNING restaurant_id
                 """
-                g.conn.execute(
+                result = g.conn.execute(
                     text(insert_restaurant),
                     {"name": name, "address": address, "cuisine": cuisine})
+                restaurant_id = result.fetchone()[0]
                 g.conn.commit()
+                name_index.add_restaurant(restaurant_id, name)
                 return redirect('/restaurant')
             except Exception as e:
                 print(str(e))
@@ -318,9 +847,12 @@ def add_review():
                 insert_review = """
                 INSERT INTO Review (restaurant_id, user_id, rating, text_content, "timestamp")
                 VALUES (:restaurant_id, :user_id, :rating, :text_content, CURRENT_TIMESTAMP)
+                RETURNING review_id
                 """
-                g.conn.execute(text(insert_review), {"restaurant_id": restaurant_id, "user_id": user_id, "rating": rating, "text_content": text_content})
+                result = g.conn.execute(text(insert_review), {"restaurant_id": restaurant_id, "user_id": user_id, "rating": rating, "text_content": text_content})
+                review_id = result.fetchone()[0]
                 g.conn.commit()
+                name_index.add_review(review_id, int(restaurant_id), float(rating))
                 return redirect('/')
             except Exception as e:
                 print(e)
@@ -485,6 +1017,27 @@ def dishes():
         return render_template("dishes.html", **context)
     else:
         return redirect('/login')
+
+#
+# Typeahead suggestions for the search boxes on restaurant.html and dishes.html, e.g.
+#
+#     localhost:8111/autocomplete?q=piz&type=dish
+#
+# Answered from name_index, so no database connection is taken for the request.
+#
+@app.route('/autocomplete', methods=['GET'])
+def autocomplete():
+    user_id = request.cookies.get('user_id')
+
+    if user_id:
+        prefix = request.args.get('q', '')
+        kind = request.args.get('type') or None
+        if kind not in (None, 'restaurant', 'dish'):
+            abort(400)
+        limit = max(1, min(request.args.get('limit', AUTOCOMPLETE_LIMIT, type=int), AUTOCOMPLETE_MAX_LIMIT))
+        return jsonify(results=name_index.search(prefix, kind, limit))
+    else:
+        return jsonify(results=[]), 401
     
 
 @app.route('/restaurant/<int:restaurant_id>', methods=['GET'])
@@ -666,6 +1219,7 @@ def add_dish():
                     )
 
                 g.conn.commit()
+                name_index.add_dish(dish_id, name, int(restaurant_id))
                 return redirect('/dishes')
             except Exception as e:
                 print(str(e))
@@ -687,6 +1241,55 @@ def logout():
     resp.delete_cookie("user_id")
     return resp
 
+@app.route('/metrics')
+def metrics():
+    admission = {name: lim.stats() for name, lim in route_limiters.items()}
+    admission["reserved"] = reserved_limiter.stats()
+    admission["shared"] = shared_limiter.stats()
+    return jsonify(admission=admission, reserved_slots=RESERVED_SLOTS, pool_capacity=POOL_CAPACITY)
+
+#
+# Admin pages for browsing saved profiles. They need the same X-Profile header, e.g.
+#
+#     curl -H "X-Profile: <PROFILE_TOKEN>" localhost:8111/admin/profiles
+#
+def check_admin_token():
+    if not has_profile_token():
+        abort(404)
+
+@app.route('/admin/profiles')
+def admin_profiles():
+    check_admin_token()
+    profiles = []
+    if os.path.isdir(PROFILE_DIR):
+        for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+            if not name.endswith(".json"):
+                continue
+            record = read_profile(name[:-len(".json")], summary_only=True)
+            if record is None:
+                continue
+            profiles.append({
+                "id": record["id"],
+                "path": record["path"],
+                "method": record["method"],
+                "duration_ms": record["duration_ms"],
+                "samples": record["samples"],
+                "peak_bytes": record["peak_bytes"]
+            })
+    return jsonify(profiles=profiles)
+
+@app.route('/admin/profiles/<profile_id>')
+def admin_profile(profile_id):
+    check_admin_token()
+    return jsonify(load_profile(profile_id))
+
+@app.route('/admin/profiles/<profile_id>/collapsed')
+def admin_profile_collapsed(profile_id):
+    check_admin_token()
+    record = load_profile(profile_id)
+    lines = [f"{stack} {count}" for stack, count in sorted(record["stacks"].items())]
+    return Response("\n".join(lines) + "\n", mimetype="text/plain")
+
 if __name__ == "__main__":
     import click
 